@@ -5,7 +5,7 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -22,11 +22,11 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -37,13 +37,15 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    # Keep timestamps the caller already set so it can echo what was stored
+    now = datetime.now(timezone.utc)
+    data_dict.setdefault('created_at', now)
+    data_dict.setdefault('updated_at', now)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -52,4 +54,41 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit or None)
+
+def stream_api_documents(collection_name: str, filter_dict: dict = None, limit: int = None, fields: tuple = None, sort: dict = None):
+    """Cursor over documents shaped for API responses, with a string "id" in place of "_id"
+
+    When fields are given, every document has exactly "id" followed by those
+    fields, in that order, with null for any field the document lacks.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    pipeline = [{"$match": filter_dict or {}}]
+    if sort:
+        pipeline.append({"$sort": sort})
+    if limit:
+        pipeline.append({"$limit": limit})
+    if fields:
+        shape = {"_id": 0, "id": {"$toString": "$_id"}}
+        shape.update({f: {"$ifNull": [f"${f}", None]} for f in fields})
+        pipeline.append({"$project": shape})
+    else:
+        pipeline.append({"$addFields": {"id": {"$toString": "$_id"}}})
+        pipeline.append({"$project": {"_id": 0}})
+
+    return db[collection_name].aggregate(pipeline)
+
+async def ensure_indexes():
+    """Create the indexes used by the API's hot queries"""
+    if db is None:
+        return
+
+    await db["resource"].create_index([("status", 1), ("semester", 1), ("subject", 1)], background=True)
+    await db["resource"].create_index([("uploaded_by", 1), ("status", 1)], background=True)
+    # Let the newest-first cursor pagination sort straight off an index,
+    # with and without a semester filter
+    await db["resource"].create_index([("status", 1), ("_id", -1)], background=True)
+    await db["resource"].create_index([("status", 1), ("semester", 1), ("_id", -1)], background=True)
+    await db["user"].create_index("email", unique=True, background=True)
@@ -1,18 +1,39 @@
 import os
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
 
 from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
 import asyncio
+import functools
+import logging
+import re
+import orjson
 
-from database import db, create_document, get_documents
-from schemas import User as UserSchema, Resource as ResourceSchema, Notification as NotificationSchema
+from database import db, create_document, stream_api_documents, ensure_indexes
 from bson import ObjectId
+from pymongo.collection import ReturnDocument
 
-app = FastAPI(title="CSE Resource Sharing Platform API")
+logger = logging.getLogger(__name__)
+
+
+# Mongo hands back naive datetimes that are in UTC
+JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def json_dumps(content: Any) -> bytes:
+    """orjson encoding; datetimes are native, ObjectId falls back to str()"""
+    return orjson.dumps(content, default=str, option=JSON_OPTIONS)
+
+
+class APIJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+app = FastAPI(title="CSE Resource Sharing Platform API", default_response_class=APIJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,26 +43,100 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+async def create_indexes():
+    # Missing indexes only cost speed; don't let them keep the API (and /test) down
+    try:
+        await ensure_indexes()
+    except Exception:
+        logger.exception("Could not create database indexes")
+
+
+@app.on_event("startup")
+async def start_index_build():
+    # Build in the background so an unreachable database can't hold up startup
+    # for the driver's server selection timeout. Keep a reference to the task
+    # so it isn't garbage collected mid-build.
+    app.state.index_task = asyncio.create_task(create_indexes())
+
+
 # ----------------------
 # Utilities
 # ----------------------
 
+OBJECT_ID_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+
+@functools.lru_cache(maxsize=4096)
+def _oid_cached(id_str: str) -> ObjectId:
+    return ObjectId(id_str)
+
+
 def oid(id_str: str) -> ObjectId:
-    try:
-        return ObjectId(id_str)
-    except Exception:
+    # Check the format up front instead of paying for a raised exception
+    if not OBJECT_ID_RE.fullmatch(id_str):
         raise HTTPException(status_code=400, detail="Invalid id")
+    return _oid_cached(id_str)
+
+
+USER_FIELDS = (
+    "name",
+    "email",
+    "role",
+    "semester",
+    "department",
+    "is_active",
+    "created_at",
+    "updated_at",
+)
 
+RESOURCE_FIELDS = (
+    "title",
+    "description",
+    "semester",
+    "subject",
+    "tags",
+    "file_url",
+    "content_url",
+    "uploaded_by",
+    "uploader_name",
+    "status",
+    "approved_by",
+    "approved_at",
+    "created_at",
+    "updated_at",
+)
 
-def clean(doc: Dict[str, Any]):
-    if not doc:
-        return doc
-    doc["id"] = str(doc.pop("_id"))
-    # Convert datetimes to isoformat
-    for k, v in list(doc.items()):
-        if isinstance(v, datetime):
-            doc[k] = v.isoformat()
-    return doc
+
+def shape(doc: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Build a response dict with "id" first and a fixed set of keys.
+
+    Every response of one kind has the same keys in the same order. ObjectId
+    and datetimes are left for json_dumps to encode.
+    """
+    out = {"id": doc["_id"]}
+    for f in fields:
+        out[f] = doc.get(f)
+    return out
+
+
+async def stream_json_array(first: Optional[Dict[str, Any]], cursor) -> AsyncIterator[bytes]:
+    """Encode an already-started cursor as a JSON array one document at a time"""
+    if first is None:
+        yield b"[]"
+        return
+    yield b"[" + json_dumps(first)
+    async for doc in cursor:
+        yield b"," + json_dumps(doc)
+    yield b"]"
+
+
+async def json_array_response(cursor) -> StreamingResponse:
+    # Run the query and fetch the first batch before the 200 goes out, so
+    # query errors still surface as error statuses. The rest is streamed so
+    # only one document is held in memory at a time.
+    first = await anext(cursor, None)
+    return StreamingResponse(stream_json_array(first, cursor), media_type="application/json")
 
 
 # ----------------------
@@ -55,12 +150,10 @@ class LoginRequest(BaseModel):
 
 
 @app.post("/auth/login")
-def login(payload: LoginRequest):
+async def login(payload: LoginRequest):
     # Upsert user record
     if db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
-    users = db["user"]
-    existing = users.find_one({"email": payload.email})
     doc = {
         "name": payload.name,
         "email": payload.email,
@@ -70,14 +163,13 @@ def login(payload: LoginRequest):
         "is_active": True,
         "updated_at": datetime.now(timezone.utc),
     }
-    if existing:
-        users.update_one({"_id": existing["_id"]}, {"$set": doc})
-        existing.update(doc)
-        return clean(existing)
-    else:
-        created_id = create_document("user", doc)
-        new_doc = users.find_one({"_id": ObjectId(created_id)})
-        return clean(new_doc)
+    user = await db["user"].find_one_and_update(
+        {"email": payload.email},
+        {"$set": doc, "$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return APIJSONResponse(shape(user, USER_FIELDS))
 
 
 # ----------------------
@@ -86,7 +178,7 @@ def login(payload: LoginRequest):
 class CreateResourceRequest(BaseModel):
     title: str
     description: Optional[str] = None
-    semester: int
+    semester: int = Field(..., ge=1, le=8)
     subject: str
     tags: List[str] = []
     file_url: Optional[str] = None
@@ -97,44 +189,80 @@ class CreateResourceRequest(BaseModel):
 
 @app.post("/resources")
 async def create_resource(payload: CreateResourceRequest):
-    data = ResourceSchema(
-        title=payload.title,
-        description=payload.description,
-        semester=payload.semester,
-        subject=payload.subject,
-        tags=payload.tags or [],
-        file_url=payload.file_url,
-        content_url=payload.content_url,
-        uploaded_by=payload.uploaded_by,
-        uploader_name=payload.uploader_name,
-        status="pending",
-    ).model_dump()
-
-    rid = create_document("resource", data)
+    # Every client-supplied field, including the semester range, is checked
+    # by CreateResourceRequest; the rest is set here. So build the record
+    # (shaped like schemas.Resource) directly without another Pydantic pass.
+    data = {
+        "title": payload.title,
+        "description": payload.description,
+        "semester": payload.semester,
+        "subject": payload.subject,
+        "tags": payload.tags or [],
+        "file_url": payload.file_url,
+        "content_url": payload.content_url,
+        "uploaded_by": payload.uploaded_by,
+        "uploader_name": payload.uploader_name,
+        "status": "pending",
+        "approved_by": None,
+        "approved_at": None,
+    }
+    # Generate the id client-side so the notification doesn't have to wait
+    # for the resource insert to learn it
+    data["_id"] = ObjectId()
+    rid = str(data["_id"])
+    # Stamp here rather than in create_document so the response carries them,
+    # truncated to the millisecond precision BSON dates store
+    now = datetime.now(timezone.utc)
+    data["created_at"] = data["updated_at"] = now.replace(microsecond=now.microsecond // 1000 * 1000)
 
     # Emit notification (resource_created)
-    notif = NotificationSchema(
-        type="resource_created",
-        message=f"New resource pending: {data['title']}",
-        resource_id=rid,
-        created_by=data["uploaded_by"],
-        semester=data["semester"],
-        subject=data["subject"],
-    ).model_dump()
-    create_document("notification", notif)
-    await broadcaster.broadcast({"event": "resource_created", "resource_id": rid, "title": data["title"]})
+    notif = {
+        "type": "resource_created",
+        "message": f"New resource pending: {data['title']}",
+        "resource_id": rid,
+        "created_by": data["uploaded_by"],
+        "semester": data["semester"],
+        "subject": data["subject"],
+    }
+    # Independent inserts: overlap their round trips
+    await asyncio.gather(
+        create_document("resource", data),
+        create_document("notification", notif),
+    )
+    broadcaster.broadcast({"event": "resource_created", "resource_id": rid, "title": data["title"]})
+
+    # data (id and timestamps included) is what was stored, so skip the read-back.
+    return APIJSONResponse(shape(data, RESOURCE_FIELDS))
+
+
+# Fields rendered by the resource list cards. The links are included because
+# the list is the only way clients read approved resources.
+RESOURCE_LIST_FIELDS = (
+    "title",
+    "subject",
+    "semester",
+    "status",
+    "uploaded_by",
+    "uploader_name",
+    "updated_at",
+    "tags",
+    "file_url",
+    "content_url",
+)
 
-    doc = db["resource"].find_one({"_id": ObjectId(rid)})
-    return clean(doc)
+# Lists are paginated newest-first by _id; pass the last id seen as after_id
+RESOURCE_LIST_SORT = {"_id": -1}
+MAX_PAGE_SIZE = 200
 
 
 @app.get("/resources")
-def list_resources(
+async def list_resources(
     semester: Optional[int] = Query(None),
     subject: Optional[str] = Query(None),
     status: str = Query("approved"),
     uploaded_by: Optional[str] = Query(None),
-    limit: Optional[int] = Query(100),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[str] = Query(None),
 ):
     if db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
@@ -147,19 +275,30 @@ def list_resources(
         q["status"] = status
     if uploaded_by:
         q["uploaded_by"] = uploaded_by
-    docs = get_documents("resource", q, limit)
-    return [clean(d) for d in docs]
+    if after_id:
+        q["_id"] = {"$lt": oid(after_id)}
+    cursor = stream_api_documents(
+        "resource", q, limit, fields=RESOURCE_LIST_FIELDS, sort=RESOURCE_LIST_SORT
+    )
+    return await json_array_response(cursor)
 
 
 @app.get("/resources/pending")
-def list_pending(semester: Optional[int] = None, subject: Optional[str] = None):
+async def list_pending(
+    semester: Optional[int] = None,
+    subject: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[str] = Query(None),
+):
     q: Dict[str, Any] = {"status": "pending"}
     if semester is not None:
         q["semester"] = semester
     if subject:
         q["subject"] = subject
-    docs = get_documents("resource", q, 200)
-    return [clean(d) for d in docs]
+    if after_id:
+        q["_id"] = {"$lt": oid(after_id)}
+    cursor = stream_api_documents("resource", q, limit, fields=RESOURCE_FIELDS, sort=RESOURCE_LIST_SORT)
+    return await json_array_response(cursor)
 
 
 class ApproveRequest(BaseModel):
@@ -169,13 +308,13 @@ class ApproveRequest(BaseModel):
 @app.post("/resources/{resource_id}/approve")
 async def approve_resource(resource_id: str, payload: ApproveRequest):
     rcol = db["resource"]
-    doc = rcol.find_one({"_id": oid(resource_id)})
+    doc = await rcol.find_one({"_id": oid(resource_id)})
     if not doc:
         raise HTTPException(status_code=404, detail="Resource not found")
     if doc.get("status") == "approved":
-        return clean(doc)
+        return APIJSONResponse(shape(doc, RESOURCE_FIELDS))
 
-    rcol.update_one(
+    updated = await rcol.find_one_and_update(
         {"_id": doc["_id"]},
         {
             "$set": {
@@ -185,50 +324,71 @@ async def approve_resource(resource_id: str, payload: ApproveRequest):
                 "updated_at": datetime.now(timezone.utc),
             }
         },
+        return_document=ReturnDocument.AFTER,
     )
-    updated = rcol.find_one({"_id": doc["_id"]})
+    if not updated:
+        raise HTTPException(status_code=404, detail="Resource not found")
 
-    # Notification
-    notif = NotificationSchema(
-        type="resource_approved",
-        message=f"Resource approved: {updated['title']}",
-        resource_id=str(updated["_id"]),
-        created_by=payload.approved_by,
-        semester=updated.get("semester"),
-        subject=updated.get("subject"),
-    ).model_dump()
-    create_document("notification", notif)
-    await broadcaster.broadcast({"event": "resource_approved", "resource_id": str(updated["_id"])})
+    # Notification (server-built, shaped like schemas.Notification)
+    notif = {
+        "type": "resource_approved",
+        "message": f"Resource approved: {updated['title']}",
+        "resource_id": str(updated["_id"]),
+        "created_by": payload.approved_by,
+        "semester": updated.get("semester"),
+        "subject": updated.get("subject"),
+    }
+    await create_document("notification", notif)
+    broadcaster.broadcast({"event": "resource_approved", "resource_id": str(updated["_id"])})
 
-    return clean(updated)
+    return APIJSONResponse(shape(updated, RESOURCE_FIELDS))
 
 
 # ----------------------
 # Server-Sent Events broadcaster for realtime updates
 # ----------------------
+SSE_DATA_PREFIX = b"data: "
+SSE_EVENT_END = b"\n\n"
+
+
+def sse_frame(message: Dict[str, Any]) -> bytes:
+    """Encode a message as a framed SSE data event"""
+    return SSE_DATA_PREFIX + json_dumps(message) + SSE_EVENT_END
+
+
+SSE_CONNECTED = sse_frame({"event": "connected"})
+
+
 class Broadcaster:
+    # Per-subscriber backlog; slow clients lose their oldest events past this
+    max_queue_size = 256
+
     def __init__(self):
-        self.subscribers: List[asyncio.Queue] = []
+        # Copy-on-write: replaced on (rare) subscription changes so the
+        # (hot) broadcast path can iterate it without taking a snapshot
+        self.subscribers: Tuple[asyncio.Queue, ...] = ()
 
     async def subscribe(self) -> asyncio.Queue:
-        q: asyncio.Queue = asyncio.Queue()
-        self.subscribers.append(q)
+        q: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.subscribers = self.subscribers + (q,)
         # On subscribe, send a hello event
-        await q.put({"event": "connected"})
+        await q.put(SSE_CONNECTED)
         return q
 
     def unsubscribe(self, q: asyncio.Queue):
-        try:
-            self.subscribers.remove(q)
-        except ValueError:
-            pass
+        self.subscribers = tuple(s for s in self.subscribers if s is not q)
 
-    async def broadcast(self, message: Dict[str, Any]):
-        for q in list(self.subscribers):
+    def broadcast(self, message: Dict[str, Any]):
+        # Fan-out never blocks, so there is nothing to await or gather.
+        # Serialize once and share the framed bytes with every subscriber.
+        payload = sse_frame(message)
+        for q in self.subscribers:
             try:
-                await q.put(message)
-            except Exception:
-                pass
+                q.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Drop the oldest event rather than buffering without bound
+                q.get_nowait()
+                q.put_nowait(payload)
 
 
 broadcaster = Broadcaster()
@@ -240,8 +400,7 @@ async def events():
         q = await broadcaster.subscribe()
         try:
             while True:
-                msg = await q.get()
-                yield f"data: {msg}\n\n"
+                yield await q.get()
         finally:
             broadcaster.unsubscribe(q)
 
@@ -274,7 +433,7 @@ def get_schema():
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -290,7 +449,7 @@ def test_database():
             response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e: